@@ -6,177 +6,375 @@ Manages user access based on channel subscription with Italian interface
 
 import telebot
 from telebot import types
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import atexit
+import functools
 import time
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import random
+import re
+import secrets
+import signal
+import sqlite3
 import string
+import threading
+import unicodedata
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-from config import BOT_TOKEN, CHANNEL_ID, CHANNEL_LINK, MESSAGES, BUTTONS, HF_TOKEN, HF_API_URL, FREE_MESSAGES_LIMIT, CREDITS_PER_MESSAGE
-
-# Fake profiles database
-FAKE_PROFILES = [
-    {
-        "nome": "Sofia",
-        "eta": 22,
-        "foto": "https://i.imgur.com/dJ8k2Vm.jpg"
-    },
-    {
-        "nome": "Giulia",
-        "eta": 24,
-        "foto": "https://i.imgur.com/fX9mN4p.jpg"
-    },
-    {
-        "nome": "Martina",
-        "eta": 21,
-        "foto": "https://i.imgur.com/hK7vR2s.jpg"
-    },
-    {
-        "nome": "Francesca",
-        "eta": 26,
-        "foto": "https://i.imgur.com/bL3nM8q.jpg"
-    },
-    {
-        "nome": "Chiara",
-        "eta": 23,
-        "foto": "https://i.imgur.com/rT6wP9m.jpg"
-    },
-    {
-        "nome": "Alessia",
-        "eta": 25,
-        "foto": "https://i.imgur.com/sQ4vX7k.jpg"
-    },
-    {
-        "nome": "Valentina",
-        "eta": 20,
-        "foto": "https://i.imgur.com/mH8nL5r.jpg"
-    },
-    {
-        "nome": "Elena",
-        "eta": 27,
-        "foto": "https://i.imgur.com/nK9pQ3w.jpg"
-    },
-    {
-        "nome": "Camilla",
-        "eta": 22,
-        "foto": "https://i.imgur.com/vR4sT8m.jpg"
-    },
-    {
-        "nome": "Aurora",
-        "eta": 24,
-        "foto": "https://i.imgur.com/wP7nM6q.jpg"
-    }
-]
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from config import BOT_TOKEN, CHANNEL_ID, CHANNEL_LINK, MESSAGES, BUTTONS, HF_TOKEN, HF_API_URL, FREE_MESSAGES_LIMIT, CREDITS_PER_MESSAGE, WEBHOOK_URL, WEBHOOK_PORT
+
+# Fake profiles database - namedtuples are lighter than dicts and
+# attribute access skips the per-field hashing
+Profile = namedtuple("Profile", "nome eta foto")
+
+FAKE_PROFILES = (
+    Profile("Sofia", 22, "https://i.imgur.com/dJ8k2Vm.jpg"),
+    Profile("Giulia", 24, "https://i.imgur.com/fX9mN4p.jpg"),
+    Profile("Martina", 21, "https://i.imgur.com/hK7vR2s.jpg"),
+    Profile("Francesca", 26, "https://i.imgur.com/bL3nM8q.jpg"),
+    Profile("Chiara", 23, "https://i.imgur.com/rT6wP9m.jpg"),
+    Profile("Alessia", 25, "https://i.imgur.com/sQ4vX7k.jpg"),
+    Profile("Valentina", 20, "https://i.imgur.com/mH8nL5r.jpg"),
+    Profile("Elena", 27, "https://i.imgur.com/nK9pQ3w.jpg"),
+    Profile("Camilla", 22, "https://i.imgur.com/vR4sT8m.jpg"),
+    Profile("Aurora", 24, "https://i.imgur.com/wP7nM6q.jpg")
 )
+
+# Configure logging - handlers only enqueue records; a background
+# listener thread does the formatting and stderr writes off the hot path
+_log_queue = queue.Queue(-1)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+# Attach the QueueHandler directly rather than via basicConfig - the
+# latter would give it a formatter of its own, and QueueHandler.prepare()
+# bakes that into the record, so the listener would format it twice
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
-# Initialize bot
-bot = telebot.TeleBot(BOT_TOKEN)
+# Initialize bot - threaded dispatch so one user's slow handler (e.g. an
+# AI call) doesn't block every other conversation
+bot = telebot.TeleBot(BOT_TOKEN, threaded=True, num_threads=16)
+
+# Telegram allows roughly 30 messages/second bot-wide and 1/second per
+# chat; throttle outbound sends so bursts don't trigger 429 backoffs
+GLOBAL_SEND_RATE = 30    # messages per second, bot-wide
+PER_CHAT_SEND_RATE = 1   # messages per second to a single chat
+PER_CHAT_SEND_BURST = 3  # short burst allowance (profile photo + greeting)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket - acquire() blocks until a token is available
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_global_send_bucket = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_RATE)
+_chat_send_buckets = {}   # chat_id: TokenBucket
+_chat_send_lock = threading.Lock()
+
+# A bucket untouched for this long has refilled completely and carries no
+# state, so the periodic sweep can drop it instead of keeping one per
+# chat for the life of the process
+SEND_BUCKET_IDLE_TTL = 60
+
+def prune_idle_send_buckets():
+    """
+    Remove per-chat send buckets unused for SEND_BUCKET_IDLE_TTL seconds
+    """
+    cutoff = time.monotonic() - SEND_BUCKET_IDLE_TTL
+    with _chat_send_lock:
+        idle = [cid for cid, bucket in _chat_send_buckets.items() if bucket.updated < cutoff]
+        for cid in idle:
+            del _chat_send_buckets[cid]
+
+def _throttle_send(chat_id):
+    with _chat_send_lock:
+        bucket = _chat_send_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(PER_CHAT_SEND_RATE, PER_CHAT_SEND_BURST)
+            _chat_send_buckets[chat_id] = bucket
+    bucket.acquire()
+    _global_send_bucket.acquire()
+
+_unthrottled_send_message = bot.send_message
+_unthrottled_send_photo = bot.send_photo
+
+def _rate_limited_send_message(chat_id, *args, **kwargs):
+    _throttle_send(chat_id)
+    return _unthrottled_send_message(chat_id, *args, **kwargs)
+
+def _rate_limited_send_photo(chat_id, *args, **kwargs):
+    _throttle_send(chat_id)
+    return _unthrottled_send_photo(chat_id, *args, **kwargs)
+
+bot.send_message = _rate_limited_send_message
+bot.send_photo = _rate_limited_send_photo
+
+# Database files for users
+DATABASE_FILE = "users.db"
+LEGACY_DATABASE_FILE = "users_database.txt"
+
+# Single shared connection - WAL mode allows concurrent readers
+db = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.execute("""CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    unique_id TEXT UNIQUE,
+    credits INTEGER NOT NULL DEFAULT 0,
+    city TEXT NOT NULL DEFAULT 'non selezionata',
+    free_messages_used INTEGER NOT NULL DEFAULT 0
+)""")
+db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_uid ON users(unique_id)")
+db.commit()
+
+# In-memory user cache - single-process bot, so the cache is authoritative
+# and reads never have to touch the database
+_users_cache = {}       # telegram_id: {'unique_id', 'credits', 'city', 'free_messages_used'}
+_uid_to_telegram = {}   # unique_id: telegram_id
+_cache_lock = threading.RLock()
+
+# Changed users are flushed to the database in batches by a background
+# thread instead of one commit per message
+_dirty_users = set()    # telegram_ids with unflushed changes
+FLUSH_INTERVAL = 2      # seconds between background flushes
+
+def flush_dirty_users():
+    """
+    Write all dirty cache entries to the database in a single transaction
+    """
+    with _cache_lock:
+        if not _dirty_users:
+            return
+        rows = [
+            (tid, user['unique_id'], user['credits'], user['city'], user['free_messages_used'])
+            for tid, user in ((tid, _users_cache[tid]) for tid in _dirty_users)
+        ]
+        _dirty_users.clear()
+    try:
+        db.executemany(
+            "INSERT OR REPLACE INTO users (telegram_id, unique_id, credits, city, free_messages_used) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        db.commit()
+    except Exception as e:
+        logger.error("Error flushing users to database: %s", e)
+        # Re-mark so the next flush retries
+        with _cache_lock:
+            _dirty_users.update(row[0] for row in rows)
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush_dirty_users()
+
+def load_users_cache():
+    """
+    Load all users from the database into the in-memory cache once at startup
+    """
+    with _cache_lock:
+        for row in db.execute("SELECT telegram_id, unique_id, credits, city, free_messages_used FROM users"):
+            _users_cache[row[0]] = {
+                'unique_id': row[1],
+                'credits': row[2],
+                'city': row[3],
+                'free_messages_used': row[4]
+            }
+            _uid_to_telegram[row[1]] = row[0]
+
+# Admin user IDs - frozenset for O(1) membership checks
+ADMIN_IDS = frozenset({7517832119, 7408188866, 7839114402})
+
+# Button texts the catch-all chat handler must ignore, built once
+BUTTON_SKIP_TEXTS = frozenset({
+    BUTTONS["new_chat"], BUTTONS["profile"], BUTTONS["buy_credits"],
+    "🔄 Nuovo Utente", "❌ Termina Chat"
+})
+
+@dataclass(slots=True)
+class ChatState:
+    """
+    Per-user chat session state
+    """
+    in_chat: bool
+    messages_sent: int
+    current_profile: Profile
+    last_activity: float
+
+# Chat state tracking - guarded by a lock now that handlers run on
+# multiple dispatcher threads
+user_chat_states = {}  # user_id: ChatState
+chat_states_lock = threading.Lock()
+
+# Idle sessions are dropped so abandoned chats don't accumulate forever
+CHAT_STATE_TTL = 3600         # seconds an idle chat session is kept
+CHAT_STATE_SWEEP_INTERVAL = 300
+
+def prune_idle_chat_states():
+    """
+    Remove chat sessions with no activity for CHAT_STATE_TTL seconds
+    """
+    cutoff = time.time() - CHAT_STATE_TTL
+    with chat_states_lock:
+        idle = [uid for uid, state in user_chat_states.items() if state.last_activity < cutoff]
+        for uid in idle:
+            del user_chat_states[uid]
+    if idle:
+        logger.info("Pruned %s idle chat sessions", len(idle))
 
-# Database file for users
-DATABASE_FILE = "users_database.txt"
+def _chat_state_sweep_loop():
+    while True:
+        time.sleep(CHAT_STATE_SWEEP_INTERVAL)
+        prune_idle_chat_states()
+        prune_idle_send_buckets()
 
-# Admin user IDs
-ADMIN_IDS = [7517832119, 7408188866, 7839114402]
+threading.Thread(target=_chat_state_sweep_loop, daemon=True).start()
 
-# Chat state tracking
-user_chat_states = {}  # user_id: {'in_chat': bool, 'messages_sent': int, 'current_profile': dict}
+# Alphabet for generated user IDs, concatenated once
+ID_ALPHABET = string.ascii_uppercase + string.digits
 
 def generate_user_id():
     """
     Generate a unique 5-character alphanumeric ID
     """
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
+    return ''.join(random.choices(ID_ALPHABET, k=5))
 
-def load_user_database():
+def safe_handler(fn):
     """
-    Load users from database file
-    Returns dictionary with user_id as key and user data as value
+    Centralize the log-and-swallow boilerplate around message handlers
     """
-    users = {}
-    if os.path.exists(DATABASE_FILE):
+    @functools.wraps(fn)
+    def wrapper(message, *args):
         try:
-            with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and '|' in line:
-                        parts = line.split('|')
-                        if len(parts) >= 3:
-                            telegram_id = int(parts[0])
-                            unique_id = parts[1]
-                            credits = int(parts[2])
-                            city = parts[3] if len(parts) > 3 else "non selezionata"
-                            free_messages_used = int(parts[4]) if len(parts) > 4 else 0
-                            users[telegram_id] = {
-                                'unique_id': unique_id,
-                                'credits': credits,
-                                'city': city,
-                                'free_messages_used': free_messages_used
-                            }
-        except Exception as e:
-            logger.error(f"Error loading database: {e}")
-    return users
+            return fn(message, *args)
+        except Exception:
+            logger.exception("Error in %s for user %s", fn.__name__, message.from_user.id)
+    return wrapper
 
-def save_user_to_database(telegram_id, unique_id, credits, city="non selezionata", free_messages_used=0):
+def migrate_legacy_database():
     """
-    Save or update user in database file
+    One-shot migration from the old users_database.txt flat file into SQLite
     """
+    if not os.path.exists(LEGACY_DATABASE_FILE):
+        return
     try:
-        users = load_user_database()
-        # Preserve existing values if not provided
-        if telegram_id in users:
-            if city == "non selezionata":
-                city = users[telegram_id].get('city', "non selezionata")
-            if free_messages_used == 0:
-                free_messages_used = users[telegram_id].get('free_messages_used', 0)
-
-        users[telegram_id] = {
-            'unique_id': unique_id,
-            'credits': credits,
-            'city': city,
-            'free_messages_used': free_messages_used
-        }
+        with open(LEGACY_DATABASE_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and '|' in line:
+                    parts = line.split('|')
+                    if len(parts) >= 3:
+                        telegram_id = int(parts[0])
+                        unique_id = parts[1]
+                        credits = int(parts[2])
+                        city = parts[3] if len(parts) > 3 else "non selezionata"
+                        free_messages_used = int(parts[4]) if len(parts) > 4 else 0
+                        db.execute(
+                            "INSERT OR IGNORE INTO users (telegram_id, unique_id, credits, city, free_messages_used) VALUES (?, ?, ?, ?, ?)",
+                            (telegram_id, unique_id, credits, city, free_messages_used)
+                        )
+        db.commit()
+        os.replace(LEGACY_DATABASE_FILE, LEGACY_DATABASE_FILE + ".migrated")
+        logger.info("Migrated legacy database %s to %s", LEGACY_DATABASE_FILE, DATABASE_FILE)
+    except Exception as e:
+        logger.error("Error migrating legacy database: %s", e)
 
-        with open(DATABASE_FILE, 'w', encoding='utf-8') as f:
-            for t_id, data in users.items():
-                f.write(f"{t_id}|{data['unique_id']}|{data['credits']}|{data['city']}|{data.get('free_messages_used', 0)}\n")
+migrate_legacy_database()
+load_users_cache()
+threading.Thread(target=_flush_loop, daemon=True).start()
+atexit.register(flush_dirty_users)
+
+def save_user_to_database(telegram_id, unique_id, credits, city="non selezionata", free_messages_used=0):
+    """
+    Save or update user in cache and database (write-through)
+    """
+    try:
+        with _cache_lock:
+            # Preserve existing values if not provided
+            existing = _users_cache.get(telegram_id)
+            if existing:
+                if city == "non selezionata":
+                    city = existing['city']
+                if free_messages_used == 0:
+                    free_messages_used = existing['free_messages_used']
+
+            _users_cache[telegram_id] = {
+                'unique_id': unique_id,
+                'credits': credits,
+                'city': city,
+                'free_messages_used': free_messages_used
+            }
+            _uid_to_telegram[unique_id] = telegram_id
+            _dirty_users.add(telegram_id)
     except Exception as e:
-        logger.error(f"Error saving to database: {e}")
+        logger.error("Error saving to database: %s", e)
 
 def get_or_create_user(telegram_id):
     """
-    Get user data or create new user if doesn't exist
+    Get user data from cache or create new user if doesn't exist
     """
-    users = load_user_database()
-    if telegram_id in users:
-        user_data = users[telegram_id]
-        return (user_data['unique_id'], user_data['credits'],
-                user_data.get('city', "non selezionata"),
-                user_data.get('free_messages_used', 0))
-    else:
-        # Create new user with unique ID and 0 credits
+    with _cache_lock:
+        user = _users_cache.get(telegram_id)
+        if user:
+            return (user['unique_id'], user['credits'],
+                    user['city'], user['free_messages_used'])
+
+        # Create new user with unique ID and 0 credits - the cache holds
+        # every user, so the collision check is a single dict lookup
         unique_id = generate_user_id()
-        # Ensure unique ID is actually unique
-        while any(data['unique_id'] == unique_id for data in users.values()):
+        while unique_id in _uid_to_telegram:
             unique_id = generate_user_id()
 
-        save_user_to_database(telegram_id, unique_id, 0, "non selezionata", 0)
+        _users_cache[telegram_id] = {
+            'unique_id': unique_id,
+            'credits': 0,
+            'city': "non selezionata",
+            'free_messages_used': 0
+        }
+        _uid_to_telegram[unique_id] = telegram_id
+        _dirty_users.add(telegram_id)
         return unique_id, 0, "non selezionata", 0
 
 def find_user_by_unique_id(unique_id):
     """
     Find user by their unique ID, returns telegram_id, credits and city
     """
-    users = load_user_database()
-    for telegram_id, data in users.items():
-        if data['unique_id'] == unique_id:
-            return telegram_id, data['credits'], data.get('city', "non selezionata")
+    with _cache_lock:
+        telegram_id = _uid_to_telegram.get(unique_id)
+        if telegram_id is not None:
+            user = _users_cache[telegram_id]
+            return telegram_id, user['credits'], user['city']
     return None, None, None
 
 def is_admin(user_id):
@@ -185,9 +383,16 @@ def is_admin(user_id):
     """
     return user_id in ADMIN_IDS
 
-def check_channel_membership(user_id):
+# Membership checks are a synchronous Telegram API round-trip; cache the
+# result briefly so repeated handler checks don't pay it every time
+MEMBERSHIP_TTL = 60              # seconds a cached membership result stays valid
+MEMBERSHIP_CACHE_SIZE = 10000    # LRU bound on cached users
+_membership_cache = OrderedDict()   # user_id: (is_member, checked_at)
+_membership_lock = threading.Lock()
+
+def fetch_channel_membership(user_id):
     """
-    Check if user is subscribed to the required channel
+    Ask the Telegram API if user is subscribed to the required channel
     Returns True if subscribed, False otherwise
     """
     try:
@@ -195,9 +400,50 @@ def check_channel_membership(user_id):
         # User is considered subscribed if they are member, administrator, or creator
         return member.status in ['member', 'administrator', 'creator']
     except Exception as e:
-        logger.error(f"Error checking membership for user {user_id}: {e}")
+        logger.error("Error checking membership for user %s: %s", user_id, e)
         return False
 
+# Concurrent checks for the same user share one API call (singleflight)
+_membership_inflight = {}   # user_id: Future
+_inflight_lock = threading.Lock()
+
+def check_channel_membership(user_id):
+    """
+    Check channel membership, serving recent results from the TTL cache
+    """
+    now = time.time()
+    with _membership_lock:
+        cached = _membership_cache.get(user_id)
+        if cached and now - cached[1] < MEMBERSHIP_TTL:
+            _membership_cache.move_to_end(user_id)
+            return cached[0]
+
+    # On a cache miss the first concurrent caller issues the API call;
+    # later callers for the same user wait on the same future
+    with _inflight_lock:
+        future = _membership_inflight.get(user_id)
+        if future is None:
+            future = handler_executor.submit(fetch_channel_membership, user_id)
+            _membership_inflight[user_id] = future
+            future.add_done_callback(
+                lambda f, uid=user_id: _membership_inflight.pop(uid, None)
+            )
+    is_member = future.result()
+
+    with _membership_lock:
+        _membership_cache[user_id] = (is_member, now)
+        _membership_cache.move_to_end(user_id)
+        while len(_membership_cache) > MEMBERSHIP_CACHE_SIZE:
+            _membership_cache.popitem(last=False)
+    return is_member
+
+def invalidate_membership_cache(user_id):
+    """
+    Drop the cached membership result so the next check hits the API
+    """
+    with _membership_lock:
+        _membership_cache.pop(user_id, None)
+
 def create_subscription_keyboard():
     """
     Create inline keyboard with channel link and refresh button
@@ -221,19 +467,21 @@ def create_subscription_keyboard():
 
     return keyboard
 
+# Keyboards never change, so build each one once at import and reuse it
+SUBSCRIPTION_KEYBOARD = create_subscription_keyboard()
+
 def send_subscription_prompt(chat_id):
     """
     Send message prompting user to subscribe to channel
     """
     try:
-        keyboard = create_subscription_keyboard()
         bot.send_message(
             chat_id=chat_id,
             text=MESSAGES["not_subscribed"],
-            reply_markup=keyboard
+            reply_markup=SUBSCRIPTION_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Error sending subscription prompt to {chat_id}: {e}")
+        logger.error("Error sending subscription prompt to %s: %s", chat_id, e)
 
 def create_main_keyboard():
     """
@@ -249,21 +497,23 @@ def create_main_keyboard():
 
     return keyboard
 
+MAIN_KEYBOARD = create_main_keyboard()
+
 def send_welcome_message(chat_id):
     """
     Send welcome message to subscribed users with main menu
     """
     try:
-        keyboard = create_main_keyboard()
         bot.send_message(
             chat_id=chat_id,
             text=MESSAGES["welcome"],
-            reply_markup=keyboard
+            reply_markup=MAIN_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Error sending welcome message to {chat_id}: {e}")
+        logger.error("Error sending welcome message to %s: %s", chat_id, e)
 
 @bot.message_handler(commands=['start'])
+@safe_handler
 def handle_start(message):
     """
     Handle /start command - check subscription and respond accordingly
@@ -271,7 +521,7 @@ def handle_start(message):
     user_id = message.from_user.id
     chat_id = message.chat.id
 
-    logger.info(f"User {user_id} started the bot")
+    logger.info("User %s started the bot", user_id)
 
     # Check if user is subscribed to the channel
     if check_channel_membership(user_id):
@@ -289,12 +539,15 @@ def handle_refresh_callback(call):
     chat_id = call.message.chat.id
     message_id = call.message.message_id
 
-    logger.info(f"User {user_id} clicked refresh button")
+    logger.info("User %s clicked refresh button", user_id)
 
     try:
         # Answer callback query to stop loading indicator
         bot.answer_callback_query(call.id, MESSAGES["checking"])
 
+        # User explicitly asked for a re-check - bypass the cache
+        invalidate_membership_cache(user_id)
+
         # Check current membership status
         if check_channel_membership(user_id):
             # User is now subscribed - delete old message and send welcome
@@ -308,16 +561,11 @@ def handle_refresh_callback(call):
                 show_alert=True
             )
     except Exception as e:
-        logger.error(f"Error handling refresh callback for user {user_id}: {e}")
+        logger.error("Error handling refresh callback for user %s: %s", user_id, e)
         bot.answer_callback_query(call.id, MESSAGES["error"])
 
-def send_pricing_menu(chat_id):
-    """
-    Send pricing menu with photo and buttons
-    """
-    try:
-        # Create pricing message
-        pricing_text = """Scegli il tuo piano:
+# Pricing message
+PRICING_TEXT = """Scegli il tuo piano:
 
 🔹 Piano Base
 100 Crediti - 59€
@@ -328,35 +576,47 @@ def send_pricing_menu(chat_id):
 👑 Piano Premium
 1000 Crediti - 289€"""
 
-        # Create inline keyboard with pricing plans
-        keyboard = types.InlineKeyboardMarkup()
+def create_pricing_keyboard():
+    """
+    Create inline keyboard with pricing plans
+    """
+    keyboard = types.InlineKeyboardMarkup()
 
-        piano_base_btn = types.InlineKeyboardButton(
-            text="Piano Base",
-            url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20base."
-        )
-        piano_classico_btn = types.InlineKeyboardButton(
-            text="🔥 Piano Classico",
-            url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20classico."
-        )
-        piano_elite_btn = types.InlineKeyboardButton(
-            text="👑 Piano Premium",
-            url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20premium."
-        )
+    piano_base_btn = types.InlineKeyboardButton(
+        text="Piano Base",
+        url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20base."
+    )
+    piano_classico_btn = types.InlineKeyboardButton(
+        text="🔥 Piano Classico",
+        url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20classico."
+    )
+    piano_elite_btn = types.InlineKeyboardButton(
+        text="👑 Piano Premium",
+        url="https://t.me/KataraDeana?text=Ciao,%20sono%20interessato%20al%20piano%20premium."
+    )
+
+    keyboard.add(piano_base_btn)
+    keyboard.add(piano_classico_btn)
+    keyboard.add(piano_elite_btn)
 
-        keyboard.add(piano_base_btn)
-        keyboard.add(piano_classico_btn)
-        keyboard.add(piano_elite_btn)
+    return keyboard
+
+PRICING_KEYBOARD = create_pricing_keyboard()
 
+def send_pricing_menu(chat_id):
+    """
+    Send pricing menu with photo and buttons
+    """
+    try:
         # Send photo with pricing text and buttons
         bot.send_photo(
             chat_id=chat_id,
             photo="https://i.imgur.com/kfIj7Ik.png",
-            caption=pricing_text,
-            reply_markup=keyboard
+            caption=PRICING_TEXT,
+            reply_markup=PRICING_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Error sending pricing menu to {chat_id}: {e}")
+        logger.error("Error sending pricing menu to %s: %s", chat_id, e)
 
 @bot.callback_query_handler(func=lambda call: call.data == "show_pricing")
 def handle_show_pricing_callback(call):
@@ -365,13 +625,13 @@ def handle_show_pricing_callback(call):
     """
     user_id = call.from_user.id
     chat_id = call.message.chat.id
-    logger.info(f"User {user_id} clicked show pricing button from profile")
+    logger.info("User %s clicked show pricing button from profile", user_id)
 
     try:
         bot.answer_callback_query(call.id, "Caricamento piani...")
         send_pricing_menu(chat_id)
     except Exception as e:
-        logger.error(f"Error handling show pricing callback for user {user_id}: {e}")
+        logger.error("Error handling show pricing callback for user %s: %s", user_id, e)
 
 @bot.callback_query_handler(func=lambda call: call.data == "select_city")
 def handle_select_city_callback(call):
@@ -380,7 +640,7 @@ def handle_select_city_callback(call):
     """
     user_id = call.from_user.id
     chat_id = call.message.chat.id
-    logger.info(f"User {user_id} clicked select city button")
+    logger.info("User %s clicked select city button", user_id)
 
     try:
         bot.answer_callback_query(call.id, "Inserisci la tua città...")
@@ -389,34 +649,36 @@ def handle_select_city_callback(call):
         # Set user state to expect city input
         bot.register_next_step_handler(call.message, process_city_input, user_id)
     except Exception as e:
-        logger.error(f"Error handling select city callback for user {user_id}: {e}")
-
-def get_italian_cities():
-    """
-    Returns a set of valid Italian cities (major cities and provincial capitals)
-    """
-    return {
-        # Capoluoghi di regione e province principali
-        'roma', 'milano', 'napoli', 'torino', 'palermo', 'genova', 'bologna', 'firenze', 'bari', 'catania',
-        'venezia', 'verona', 'messina', 'padova', 'trieste', 'taranto', 'brescia', 'parma', 'prato', 'modena',
-        'reggio calabria', 'reggio emilia', 'perugia', 'livorno', 'ravenna', 'cagliari', 'foggia', 'rimini',
-        'salerno', 'ferrara', 'sassari', 'latina', 'giugliano in campania', 'monza', 'siracusa', 'pescara',
-        'bergamo', 'forlì', 'trento', 'vicenza', 'terni', 'bolzano', 'novara', 'piacenza', 'ancona', 'andria',
-        'arezzo', 'udine', 'cesena', 'lecce', 'pesaro', 'barletta', 'alessandria', 'como', 'pistoia', 'pavia',
-        'treviso', 'catanzaro', 'caserta', 'brindisi', 'grosseto', 'asti', 'varese', 'cremona', 'cosenza',
-        'vigevano', 'trapani', 'crotone', 'potenza', 'viterbo', 'vercelli', 'cuneo', 'caltanissetta', 'agrigento',
-        'matera', 'enna', 'ragusa', 'l\'aquila', 'chieti', 'teramo', 'pescara', 'campobasso', 'isernia',
-        'benevento', 'avellino', 'caserta', 'frosinone', 'rieti', 'viterbo', 'tivoli', 'guidonia montecelio',
-        'fiumicino', 'pomezia', 'aprilia', 'velletri', 'civitavecchia', 'anzio', 'nettuno', 'marino', 'frascati',
-        'genzano di roma', 'albano laziale', 'monterotondo', 'mentana', 'fonte nuova', 'riano', 'fiano romano',
-        # Aggiungere altre città importanti
-        'aosta', 'pordenone', 'gorizia', 'imperia', 'savona', 'la spezia', 'massa', 'carrara', 'lucca', 'siena',
-        'grosseto', 'terni', 'rieti', 'viterbo', 'latina', 'frosinone', 'isernia', 'campobasso', 'teramo',
-        'pescara', 'chieti', 'l\'aquila', 'potenza', 'matera', 'cosenza', 'catanzaro', 'reggio calabria',
-        'crotone', 'vibo valentia', 'trapani', 'palermo', 'messina', 'agrigento', 'caltanissetta', 'enna',
-        'catania', 'ragusa', 'siracusa', 'cagliari', 'sassari', 'nuoro', 'oristano', 'carbonia', 'iglesias',
-        'olbia', 'tempio pausania'
-    }
+        logger.error("Error handling select city callback for user %s: %s", user_id, e)
+
+def normalize_city_name(name):
+    """
+    Fold accents and case so 'Forlì', 'forli' and 'FORLÌ' all compare equal
+    """
+    folded = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return folded.casefold().strip()
+
+# Valid Italian cities (major cities and provincial capitals) - built once
+# at import instead of rebuilding the set on every city input, normalized
+# the same way user input is
+ITALIAN_CITIES = frozenset(normalize_city_name(city) for city in {
+    # Capoluoghi di regione e province principali
+    'roma', 'milano', 'napoli', 'torino', 'palermo', 'genova', 'bologna', 'firenze', 'bari', 'catania',
+    'venezia', 'verona', 'messina', 'padova', 'trieste', 'taranto', 'brescia', 'parma', 'prato', 'modena',
+    'reggio calabria', 'reggio emilia', 'perugia', 'livorno', 'ravenna', 'cagliari', 'foggia', 'rimini',
+    'salerno', 'ferrara', 'sassari', 'latina', 'giugliano in campania', 'monza', 'siracusa', 'pescara',
+    'bergamo', 'forlì', 'trento', 'vicenza', 'terni', 'bolzano', 'novara', 'piacenza', 'ancona', 'andria',
+    'arezzo', 'udine', 'cesena', 'lecce', 'pesaro', 'barletta', 'alessandria', 'como', 'pistoia', 'pavia',
+    'treviso', 'catanzaro', 'caserta', 'brindisi', 'grosseto', 'asti', 'varese', 'cremona', 'cosenza',
+    'vigevano', 'trapani', 'crotone', 'potenza', 'viterbo', 'vercelli', 'cuneo', 'caltanissetta',
+    'agrigento', 'matera', 'enna', 'ragusa', "l'aquila", 'chieti', 'teramo', 'campobasso', 'isernia',
+    'benevento', 'avellino', 'frosinone', 'rieti', 'tivoli', 'guidonia montecelio', 'fiumicino', 'pomezia',
+    'aprilia', 'velletri', 'civitavecchia', 'anzio', 'nettuno', 'marino', 'frascati', 'genzano di roma',
+    'albano laziale', 'monterotondo', 'mentana', 'fonte nuova', 'riano', 'fiano romano',
+    # Altre città importanti
+    'aosta', 'pordenone', 'gorizia', 'imperia', 'savona', 'la spezia', 'massa', 'carrara', 'lucca', 'siena',
+    'vibo valentia', 'nuoro', 'oristano', 'carbonia', 'iglesias', 'olbia', 'tempio pausania'
+})
 
 def process_city_input(message, user_id):
     """
@@ -436,11 +698,10 @@ def process_city_input(message, user_id):
             return
 
         # Normalize city name for comparison
-        normalized_city = city_name.lower().strip()
-        italian_cities = get_italian_cities()
+        normalized_city = normalize_city_name(city_name)
 
         # Check if the city is in our list of valid Italian cities
-        if normalized_city not in italian_cities:
+        if normalized_city not in ITALIAN_CITIES:
             bot.send_message(chat_id, "❌ Città non trovata. Inserisci una città italiana valida (es: Roma, Milano, Napoli).")
             return
 
@@ -453,10 +714,10 @@ def process_city_input(message, user_id):
 
         bot.send_message(chat_id, f"✅ Città aggiornata: {proper_city_name}")
 
-        logger.info(f"User {user_id} updated city to: {proper_city_name}")
+        logger.info("User %s updated city to: %s", user_id, proper_city_name)
 
     except Exception as e:
-        logger.error(f"Error processing city input for user {user_id}: {e}")
+        logger.error("Error processing city input for user %s: %s", user_id, e)
         bot.send_message(chat_id, "❌ Errore durante l'aggiornamento della città.")
 
 
@@ -469,123 +730,126 @@ def create_chat_keyboard():
     keyboard.add("🔄 Nuovo Utente", "❌ Termina Chat")
     return keyboard
 
+CHAT_KEYBOARD = create_chat_keyboard()
+
+# Spicy response patterns with provocative content - {profile_name} is
+# filled in when a response is picked
+RESPONSE_PATTERNS = {
+    'ciao': [
+        "Ciao bello! 😈 Hai voglia di giocare con me?",
+        "Ehi tesoro! 🔥 Mi hai fatto venire voglia di te...",
+        "Ciao amore! 💋 Spero tu sia pronto per me!"
+    ],
+    'grazie': [
+        "Prego baby! 😏 Ora tocca a te farmi felice...",
+        "Figurati! 🔥 Dimmi cosa vorresti fare con me...",
+        "Di niente sexy! 💋 Raccontami le tue fantasie!"
+    ],
+    'bene': [
+        "Perfetto! 😈 Anch'io sto bene... anzi bollente!",
+        "Fantastico! 🔥 Io sono tutta eccitata oggi!",
+        "Che bello! 💋 Dimmi, hai voglia di divertirti?"
+    ],
+    'come va': [
+        "Benissimo! 😈 Sto pensando a te nudo... e tu?",
+        "Alla grande! 🔥 Ho una voglia matta di te!",
+        "Perfetto! 💋 Sono tutta calda oggi! Raccontami di te!",
+        "Benissimo grazie! 😏 Stavo fantasticando su di te...",
+        "Molto bene! 🔥 Ho fatto sogni piccanti stanotte!"
+    ],
+    'come stai': [
+        "Benissimo! 😈 Ma sarei meglio se fossi qui con me...",
+        "Alla grande! 🔥 Tu invece... hai voglia di me?",
+        "Perfetta! 💋 Soprattutto ora che ci sei tu!",
+        "Molto bene! 😏 Sono sempre eccitata quando parlo con te!"
+    ],
+    'cosa fai': [
+        "Sto pensando a te! 😈 E a quello che vorrei farti...",
+        "Niente di speciale... 🔥 Ma ho certe fantasie...",
+        "Stavo toccandomi pensando a te! 💋 Tu cosa fai?",
+        "Sto qui tutta nuda ad aspettarti! 😏 E tu?"
+    ],
+    'bello': [
+        "Grazie tesoro! 🔥 Tu invece mi fai venire voglia...",
+        "Sei dolce! 😈 Ma io sono anche molto cattiva...",
+        "Aww! 💋 Tu mi fai sentire così sexy!"
+    ],
+    'casino': [
+        "Il casino? 😏 Preferisco giocare con te... se capisci cosa intendo!",
+        "Anche tu giochi? 🔥 Io preferisco altri tipi di giochi... più intimi!",
+        "Al casino? 😈 Io scommetterei tutto su di noi due insieme!"
+    ],
+    'scopo': [
+        "Oh mio dio! 😈 Sei proprio diretto! Mi piacciono gli uomini così...",
+        "Che cattivo che sei! 🔥 Ma ammetto che mi ecciti...",
+        "Mmm... 💋 Parli come uno che sa quello che vuole!"
+    ],
+    'madre': [
+        "Che maleducato! 😏 Ma devo ammettere che mi piace quando sei così...",
+        "Ooh! 😈 Hai un caratterino! Mi eccita quando ti arrabbi...",
+        "Che linguaggio! 🔥 Ma sai cosa? Mi stai facendo venire voglia..."
+    ],
+    'come ti chiami': [
+        "Mi chiamo {profile_name}! 😈 E tu come ti chiami, bello?",
+        "Sono {profile_name}! 🔥 Ma puoi chiamarmi come vuoi... anche 'mia'!",
+        "{profile_name}, piacere! 💋 Spero di piacere anche a te!"
+    ],
+    'nome': [
+        "Il mio nome è {profile_name}! 😈 Ma tu urlalo quando...",
+        "Sono {profile_name}! 🔥 Dimmi il tuo, così so come chiamarti!",
+        "Mi chiamo {profile_name}! 💋 Ma preferisco quando mi chiami 'baby'!"
+    ],
+    'cosa mi faresti': [
+        "Ti farei impazzire! 😈 Ti toccherei ovunque finché non implori...",
+        "Mmm... tante cose cattive! 🔥 Ti farei venire voglia come non mai!",
+        "Inizierei baciandoti il collo... 💋 poi scendiamo sempre più giù!",
+        "Ti farei sentire come un re! 😏 E tu cosa faresti a me?",
+        "Oh tesoro... 🔥 ti farei cose che non hai mai provato!"
+    ],
+    'faresti': [
+        "Ti farei impazzire di piacere! 😈 Dimmi dove vorresti essere toccato...",
+        "Tante cose piccanti! 🔥 Vuoi che te le racconti tutte?",
+        "Ti farei sentire in paradiso! 💋 E tu a me cosa faresti?",
+        "Cose molto cattive! 😏 Sei pronto per me?"
+    ],
+    'voglia': [
+        "Anch'io ho tanta voglia di te! 😈 Vieni qui da me...",
+        "La voglia che ho è incredibile! 🔥 Non riesco a smettere di pensarti!",
+        "Ho una voglia matta! 💋 Dimmi cosa vuoi fare insieme...",
+        "Sono tutta bagnata dalla voglia! 😏 Tu invece?"
+    ],
+    'nudo': [
+        "Mmm... mi piace come pensi! 😈 Anch'io sono senza niente addosso!",
+        "Perfetto! 🔥 Così posso toccarti meglio ovunque!",
+        "Che bello! 💋 Dimmi cosa vedi quando mi guardi nuda...",
+        "Sono già pronta per te! 😏 Vieni a prendermi!"
+    ],
+    'sesso': [
+        "Oh sì baby! 😈 Sono sempre pronta per te!",
+        "Mi piace quando parli così! 🔥 Raccontami le tue fantasie...",
+        "Dimmi come lo vuoi! 💋 Sono tutta per te!",
+        "Sono già eccitata solo a sentirti! 😏 Quando ci vediamo?"
+    ]
+}
+
+# Single compiled scanner over all keywords, longest-first so the regex
+# engine prefers the most specific alternative in one pass
+_RESPONSE_KEYWORDS = sorted(RESPONSE_PATTERNS, key=len, reverse=True)
+_RESPONSE_PATTERN = re.compile("|".join(re.escape(k) for k in _RESPONSE_KEYWORDS))
+
 def get_contextual_response(prompt, profile_name, conversation_history=[]):
     """
     Get contextual AI response based on user input and conversation history - more spicy version
     """
     prompt_lower = prompt.lower().strip()
-    
-    # Spicy response patterns with provocative content
-    response_patterns = {
-        'ciao': [
-            f"Ciao bello! 😈 Hai voglia di giocare con me?",
-            f"Ehi tesoro! 🔥 Mi hai fatto venire voglia di te...",
-            f"Ciao amore! 💋 Spero tu sia pronto per me!"
-        ],
-        'grazie': [
-            "Prego baby! 😏 Ora tocca a te farmi felice...",
-            "Figurati! 🔥 Dimmi cosa vorresti fare con me...",
-            "Di niente sexy! 💋 Raccontami le tue fantasie!"
-        ],
-        'bene': [
-            "Perfetto! 😈 Anch'io sto bene... anzi bollente!",
-            "Fantastico! 🔥 Io sono tutta eccitata oggi!",
-            "Che bello! 💋 Dimmi, hai voglia di divertirti?"
-        ],
-        'come va': [
-            "Benissimo! 😈 Sto pensando a te nudo... e tu?",
-            "Alla grande! 🔥 Ho una voglia matta di te!",
-            "Perfetto! 💋 Sono tutta calda oggi! Raccontami di te!",
-            "Benissimo grazie! 😏 Stavo fantasticando su di te...",
-            "Molto bene! 🔥 Ho fatto sogni piccanti stanotte!"
-        ],
-        'come stai': [
-            "Benissimo! 😈 Ma sarei meglio se fossi qui con me...",
-            "Alla grande! 🔥 Tu invece... hai voglia di me?",
-            "Perfetta! 💋 Soprattutto ora che ci sei tu!",
-            "Molto bene! 😏 Sono sempre eccitata quando parlo con te!"
-        ],
-        'cosa fai': [
-            "Sto pensando a te! 😈 E a quello che vorrei farti...",
-            "Niente di speciale... 🔥 Ma ho certe fantasie...",
-            "Stavo toccandomi pensando a te! 💋 Tu cosa fai?",
-            "Sto qui tutta nuda ad aspettarti! 😏 E tu?"
-        ],
-        'bello': [
-            "Grazie tesoro! 🔥 Tu invece mi fai venire voglia...",
-            "Sei dolce! 😈 Ma io sono anche molto cattiva...",
-            "Aww! 💋 Tu mi fai sentire così sexy!"
-        ],
-        'casino': [
-            "Il casino? 😏 Preferisco giocare con te... se capisci cosa intendo!",
-            "Anche tu giochi? 🔥 Io preferisco altri tipi di giochi... più intimi!",
-            "Al casino? 😈 Io scommetterei tutto su di noi due insieme!"
-        ],
-        'scopo': [
-            "Oh mio dio! 😈 Sei proprio diretto! Mi piacciono gli uomini così...",
-            "Che cattivo che sei! 🔥 Ma ammetto che mi ecciti...",
-            "Mmm... 💋 Parli come uno che sa quello che vuole!"
-        ],
-        'madre': [
-            "Che maleducato! 😏 Ma devo ammettere che mi piace quando sei così...",
-            "Ooh! 😈 Hai un caratterino! Mi eccita quando ti arrabbi...",
-            "Che linguaggio! 🔥 Ma sai cosa? Mi stai facendo venire voglia..."
-        ],
-        'come ti chiami': [
-            f"Mi chiamo {profile_name}! 😈 E tu come ti chiami, bello?",
-            f"Sono {profile_name}! 🔥 Ma puoi chiamarmi come vuoi... anche 'mia'!",
-            f"{profile_name}, piacere! 💋 Spero di piacere anche a te!"
-        ],
-        'nome': [
-            f"Il mio nome è {profile_name}! 😈 Ma tu urlalo quando...",
-            f"Sono {profile_name}! 🔥 Dimmi il tuo, così so come chiamarti!",
-            f"Mi chiamo {profile_name}! 💋 Ma preferisco quando mi chiami 'baby'!"
-        ],
-        'cosa mi faresti': [
-            "Ti farei impazzire! 😈 Ti toccherei ovunque finché non implori...",
-            "Mmm... tante cose cattive! 🔥 Ti farei venire voglia come non mai!",
-            "Inizierei baciandoti il collo... 💋 poi scendiamo sempre più giù!",
-            "Ti farei sentire come un re! 😏 E tu cosa faresti a me?",
-            "Oh tesoro... 🔥 ti farei cose che non hai mai provato!"
-        ],
-        'faresti': [
-            "Ti farei impazzire di piacere! 😈 Dimmi dove vorresti essere toccato...",
-            "Tante cose piccanti! 🔥 Vuoi che te le racconti tutte?",
-            "Ti farei sentire in paradiso! 💋 E tu a me cosa faresti?",
-            "Cose molto cattive! 😏 Sei pronto per me?"
-        ],
-        'voglia': [
-            "Anch'io ho tanta voglia di te! 😈 Vieni qui da me...",
-            "La voglia che ho è incredibile! 🔥 Non riesco a smettere di pensarti!",
-            "Ho una voglia matta! 💋 Dimmi cosa vuoi fare insieme...",
-            "Sono tutta bagnata dalla voglia! 😏 Tu invece?"
-        ],
-        'nudo': [
-            "Mmm... mi piace come pensi! 😈 Anch'io sono senza niente addosso!",
-            "Perfetto! 🔥 Così posso toccarti meglio ovunque!",
-            "Che bello! 💋 Dimmi cosa vedi quando mi guardi nuda...",
-            "Sono già pronta per te! 😏 Vieni a prendermi!"
-        ],
-        'sesso': [
-            "Oh sì baby! 😈 Sono sempre pronta per te!",
-            "Mi piace quando parli così! 🔥 Raccontami le tue fantasie...",
-            "Dimmi come lo vuoi! 💋 Sono tutta per te!",
-            "Sono già eccitata solo a sentirti! 😏 Quando ci vediamo?"
-        ]
-    }
-    
-    # Check for specific phrases first (prioritize longer/more specific matches)
-    matched_responses = []
-    for keyword, responses in response_patterns.items():
-        if keyword in prompt_lower:
-            # Prioritize longer matches (more specific)
-            matched_responses.append((len(keyword), responses))
-    
-    if matched_responses:
-        # Get the longest match (most specific)
-        matched_responses.sort(key=lambda x: x[0], reverse=True)
-        return random.choice(matched_responses[0][1])
-    
+
+    # Check for specific phrases first - one C-level scan collects every
+    # keyword hit, then the longest (most specific) one wins
+    matches = _RESPONSE_PATTERN.findall(prompt_lower)
+    if matches:
+        best_keyword = max(matches, key=len)
+        return random.choice(RESPONSE_PATTERNS[best_keyword]).format(profile_name=profile_name)
+
     # Spicy generic responses
     if len(prompt_lower) < 10:  # Short messages
         short_responses = [
@@ -609,16 +873,32 @@ def get_contextual_response(prompt, profile_name, conversation_history=[]):
         ]
         return random.choice(long_responses)
 
+# Persistent session for Hugging Face calls - keep-alive avoids a fresh
+# TCP+TLS handshake per message, with pooling and automatic retries
+hf_session = requests.Session()
+hf_session.headers.update({
+    "Authorization": f"Bearer {HF_TOKEN}",
+    "Content-Type": "application/json"
+})
+hf_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+# Slow calls (AI inference, typing indicators) run on a worker pool so
+# they overlap each other and the credit bookkeeping in the handlers
+handler_executor = ThreadPoolExecutor(max_workers=32)
+
+# Emojis an AI reply is expected to contain - checked as one set
+# disjointness test instead of scanning the reply once per emoji
+RESPONSE_EMOJIS = frozenset({'😈', '🔥', '💋', '😏', '😊', '💕', '😘'})
+
 def query_huggingface_ai(prompt, profile_name):
     """
     Query Hugging Face NSFW AI model for spicy chat responses
     """
     try:
-        headers = {
-            "Authorization": f"Bearer {HF_TOKEN}",
-            "Content-Type": "application/json"
-        }
-
         # Create a more provocative system prompt for the NSFW model
         system_prompt = f"Tu sei {profile_name}, una ragazza italiana sexy e provocante di 20-25 anni. Rispondi in modo malizioso, seducente e un po' spinto. Usa emoji come 😈🔥💋😏. Rispondi in italiano."
         full_prompt = f"{system_prompt}\n\nUser: {prompt}\n{profile_name}:"
@@ -634,7 +914,7 @@ def query_huggingface_ai(prompt, profile_name):
             }
         }
 
-        response = requests.post(HF_API_URL, headers=headers, json=payload, timeout=15)
+        response = hf_session.post(HF_API_URL, json=payload, timeout=15)
         
         if response.status_code == 200:
             result = response.json()
@@ -652,7 +932,7 @@ def query_huggingface_ai(prompt, profile_name):
                 # Clean and validate response
                 if ai_response and len(ai_response) > 3 and len(ai_response) < 200:
                     # Add emoji if missing
-                    if not any(emoji in ai_response for emoji in ['😈', '🔥', '💋', '😏', '😊', '💕', '😘']):
+                    if RESPONSE_EMOJIS.isdisjoint(ai_response):
                         ai_response += " 😈"
                     return ai_response
         
@@ -660,7 +940,7 @@ def query_huggingface_ai(prompt, profile_name):
         return get_contextual_response(prompt, profile_name)
         
     except Exception as e:
-        logger.error(f"Error querying Hugging Face NSFW model: {e}")
+        logger.error("Error querying Hugging Face NSFW model: %s", e)
         return get_contextual_response(prompt, profile_name)
 
 def can_user_send_message(user_id):
@@ -680,7 +960,7 @@ def can_user_send_message(user_id):
 
         return False, "no_credits"
     except Exception as e:
-        logger.error(f"Error checking user message permissions: {e}")
+        logger.error("Error checking user message permissions: %s", e)
         return False, "error"
 
 def consume_user_message(user_id):
@@ -688,23 +968,45 @@ def consume_user_message(user_id):
     Consume a free message or credits when user sends a message
     """
     try:
-        unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
+        get_or_create_user(user_id)
 
-        # Use free message first
-        if free_messages_used < FREE_MESSAGES_LIMIT:
-            save_user_to_database(user_id, unique_id, credits, city, free_messages_used + 1)
-            return True, "free_message_used"
+        with _cache_lock:
+            user = _users_cache[user_id]
 
-        # Use credits
-        if credits >= CREDITS_PER_MESSAGE:
-            save_user_to_database(user_id, unique_id, credits - CREDITS_PER_MESSAGE, city, free_messages_used)
-            return True, "credits_used"
+            # Use free message first
+            if user['free_messages_used'] < FREE_MESSAGES_LIMIT:
+                user['free_messages_used'] += 1
+                _dirty_users.add(user_id)
+                return True, "free_message_used"
 
-        return False, "insufficient_credits"
+            # Use credits
+            if user['credits'] >= CREDITS_PER_MESSAGE:
+                user['credits'] -= CREDITS_PER_MESSAGE
+                _dirty_users.add(user_id)
+                return True, "credits_used"
+
+            return False, "insufficient_credits"
     except Exception as e:
-        logger.error(f"Error consuming user message: {e}")
+        logger.error("Error consuming user message: %s", e)
         return False, "error"
 
+# Greetings are fetched from the AI once per profile and then reused -
+# the greeting call was the bulk of profile-switch latency
+_greeting_cache = {}   # profile name: greeting
+_greeting_lock = threading.Lock()
+
+def get_profile_greeting(profile_name):
+    """
+    Get the AI greeting for a profile, memoized after the first fetch
+    """
+    with _greeting_lock:
+        greeting = _greeting_cache.get(profile_name)
+    if greeting is None:
+        greeting = query_huggingface_ai("Ciao", profile_name)
+        with _greeting_lock:
+            _greeting_cache[profile_name] = greeting
+    return greeting
+
 def send_random_profile(chat_id, user_city, user_id):
     """
     Send a random fake profile to the user and start AI chat
@@ -714,234 +1016,249 @@ def send_random_profile(chat_id, user_city, user_id):
         profile = random.choice(FAKE_PROFILES)
 
         # Initialize chat state
-        user_chat_states[user_id] = {
-            'in_chat': True,
-            'messages_sent': 0,
-            'current_profile': profile
-        }
+        with chat_states_lock:
+            user_chat_states[user_id] = ChatState(
+                in_chat=True,
+                messages_sent=0,
+                current_profile=profile,
+                last_activity=time.time()
+            )
 
         # Create profile message
-        profile_text = f"""👤 {profile['nome']}
-🎂 {profile['eta']} anni
+        profile_text = f"""👤 {profile.nome}
+🎂 {profile.eta} anni
 📍 {user_city}"""
 
-        # Create chat keyboard
-        keyboard = create_chat_keyboard()
-
         # Send photo with profile info
         bot.send_photo(
             chat_id=chat_id,
-            photo=profile['foto'],
+            photo=profile.foto,
             caption=profile_text,
-            reply_markup=keyboard
+            reply_markup=CHAT_KEYBOARD
         )
 
         # Send AI greeting message
-        greeting = query_huggingface_ai("Ciao", profile['nome'])
-        bot.send_message(chat_id, f"💬 {profile['nome']}: {greeting}")
+        greeting = get_profile_greeting(profile.nome)
+        bot.send_message(chat_id, f"💬 {profile.nome}: {greeting}")
 
     except Exception as e:
-        logger.error(f"Error sending random profile to {chat_id}: {e}")
+        logger.error("Error sending random profile to %s: %s", chat_id, e)
 
 @bot.message_handler(func=lambda message: message.text == BUTTONS["new_chat"])
+@safe_handler
 def handle_new_chat_message(message):
     """
     Handle new chat button from keyboard - send random fake profile
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"User {user_id} clicked new chat button")
+    logger.info("User %s clicked new chat button", user_id)
 
-    try:
-        if check_channel_membership(user_id):
-            # Get user's city
-            unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
+    if check_channel_membership(user_id):
+        # Get user's city
+        unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
 
-            if city == "non selezionata":
-                bot.send_message(chat_id, "❌ Prima devi selezionare la tua città dal profilo!")
-                return
+        if city == "non selezionata":
+            bot.send_message(chat_id, "❌ Prima devi selezionare la tua città dal profilo!")
+            return
 
-            # Send random profile and start AI chat
-            send_random_profile(chat_id, city, user_id)
-        else:
-            send_subscription_prompt(chat_id)
-    except Exception as e:
-        logger.error(f"Error handling new chat message for user {user_id}: {e}")
+        # Send random profile and start AI chat
+        send_random_profile(chat_id, city, user_id)
+    else:
+        send_subscription_prompt(chat_id)
 
 @bot.message_handler(func=lambda message: message.text == "🔄 Nuovo Utente")
+@safe_handler
 def handle_new_user_message(message):
     """
     Handle new user button - send another random profile
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"User {user_id} clicked new user button")
+    logger.info("User %s clicked new user button", user_id)
 
-    try:
-        if check_channel_membership(user_id):
-            # Get user's city
-            unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
+    if check_channel_membership(user_id):
+        # Get user's city
+        unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
 
-            # Send another random profile and start new AI chat
-            send_random_profile(chat_id, city, user_id)
-        else:
-            send_subscription_prompt(chat_id)
-    except Exception as e:
-        logger.error(f"Error handling new user message for user {user_id}: {e}")
+        # Send another random profile and start new AI chat
+        send_random_profile(chat_id, city, user_id)
+    else:
+        send_subscription_prompt(chat_id)
 
 @bot.message_handler(func=lambda message: message.text == "❌ Termina Chat")
+@safe_handler
 def handle_end_chat_message(message):
     """
     Handle end chat button - return to main menu
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"User {user_id} clicked end chat button")
+    logger.info("User %s clicked end chat button", user_id)
 
-    try:
-        if check_channel_membership(user_id):
-            # End chat state
-            if user_id in user_chat_states:
-                del user_chat_states[user_id]
+    if check_channel_membership(user_id):
+        # End chat state - single lookup instead of contains-then-del
+        with chat_states_lock:
+            user_chat_states.pop(user_id, None)
 
-            # Send main menu back
-            send_welcome_message(chat_id)
-        else:
-            send_subscription_prompt(chat_id)
-    except Exception as e:
-        logger.error(f"Error handling end chat message for user {user_id}: {e}")
+        # Send main menu back
+        send_welcome_message(chat_id)
+    else:
+        send_subscription_prompt(chat_id)
+
+# Profile message template, parsed once instead of per view
+PROFILE_TEMPLATE = """👤 Nome Utente: {unique_id}
+🪙 Crediti: {credits} crediti
+💬 Messaggi gratuiti rimasti: {free_messages_left}
+📍 Citta': {city}
+
+Selezionare se si vogliono trovare persone della propria citta'"""
+
+def create_profile_keyboard():
+    """
+    Create inline keyboard with buy credits and select city buttons
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    buy_credits_btn = types.InlineKeyboardButton(
+        text="💰 Acquista Crediti",
+        callback_data="show_pricing"
+    )
+    select_city_btn = types.InlineKeyboardButton(
+        text="📍 Seleziona Citta'",
+        callback_data="select_city"
+    )
+    keyboard.add(buy_credits_btn)
+    keyboard.add(select_city_btn)
+    return keyboard
+
+PROFILE_KEYBOARD = create_profile_keyboard()
 
 @bot.message_handler(func=lambda message: message.text == BUTTONS["profile"])
+@safe_handler
 def handle_profile_message(message):
     """
     Handle profile button from keyboard - show user profile
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"User {user_id} clicked profile button")
+    logger.info("User %s clicked profile button", user_id)
 
-    try:
-        if check_channel_membership(user_id):
-            # Get or create user profile
-            unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
-
-            free_messages_left = max(0, FREE_MESSAGES_LIMIT - free_messages_used)
+    if check_channel_membership(user_id):
+        # Get or create user profile
+        unique_id, credits, city, free_messages_used = get_or_create_user(user_id)
 
-            # Create profile message
-            profile_text = f"""👤 Nome Utente: {unique_id}
-🪙 Crediti: {credits} crediti
-💬 Messaggi gratuiti rimasti: {free_messages_left}
-📍 Citta': {city}
+        free_messages_left = max(0, FREE_MESSAGES_LIMIT - free_messages_used)
 
-Selezionare se si vogliono trovare persone della propria citta'"""
+        # Create profile message
+        profile_text = PROFILE_TEMPLATE.format(
+            unique_id=unique_id,
+            credits=credits,
+            free_messages_left=free_messages_left,
+            city=city
+        )
 
-            # Create inline keyboard with buy credits and select city buttons
-            keyboard = types.InlineKeyboardMarkup()
-            buy_credits_btn = types.InlineKeyboardButton(
-                text="💰 Acquista Crediti",
-                callback_data="show_pricing"
-            )
-            select_city_btn = types.InlineKeyboardButton(
-                text="📍 Seleziona Citta'",
-                callback_data="select_city"
-            )
-            keyboard.add(buy_credits_btn)
-            keyboard.add(select_city_btn)
+        bot.send_message(
+            chat_id=chat_id,
+            text=profile_text,
+            reply_markup=PROFILE_KEYBOARD
+        )
+    else:
+        send_subscription_prompt(chat_id)
 
-            bot.send_message(
-                chat_id=chat_id,
-                text=profile_text,
-                reply_markup=keyboard
-            )
-        else:
-            send_subscription_prompt(chat_id)
-    except Exception as e:
-        logger.error(f"Error handling profile message for user {user_id}: {e}")
+def _user_is_chatting(message):
+    """
+    Dispatch filter - True only for users with an active chat session,
+    so unrelated messages never enter the handler at all
+    """
+    state = user_chat_states.get(message.from_user.id)
+    return state is not None and state.in_chat
 
-@bot.message_handler(func=lambda message: True)
+@bot.message_handler(func=_user_is_chatting)
+@safe_handler
 def handle_all_messages(message):
     """
-    Handle all text messages - AI chat or regular commands
+    Handle chat messages from users with an active AI conversation
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
     text = message.text
 
-    # Skip if user is not in chat state
-    if user_id not in user_chat_states or not user_chat_states[user_id]['in_chat']:
+    # Re-check under the lock - the session may have ended since dispatch
+    with chat_states_lock:
+        state = user_chat_states.get(user_id)
+    if state is None or not state.in_chat:
         return
 
     # Skip if message is a button command
-    if text in [BUTTONS["new_chat"], BUTTONS["profile"], BUTTONS["buy_credits"], "🔄 Nuovo Utente", "❌ Termina Chat"]:
+    if text in BUTTON_SKIP_TEXTS:
         return
 
-    logger.info(f"User {user_id} sent chat message: {text}")
+    logger.info("User %s sent chat message: %s", user_id, text)
 
-    try:
-        if not check_channel_membership(user_id):
-            send_subscription_prompt(chat_id)
-            return
-
-        # Check if user can send message
-        can_send, reason = can_user_send_message(user_id)
-
-        if not can_send:
-            if reason == "no_credits":
-                # Send credits needed message
-                bot.send_message(
-                    chat_id,
-                    "💔 Non hai abbastanza crediti per continuare la conversazione!\n\n"
-                    "🪙 Acquista crediti per continuare a chattare."
-                )
-                send_pricing_menu(chat_id)
-                return
-            else:
-                bot.send_message(chat_id, "❌ Errore durante il controllo dei crediti.")
-                return
+    if not check_channel_membership(user_id):
+        send_subscription_prompt(chat_id)
+        return
 
-        # Consume message (free or credits)
-        consumed, consumption_type = consume_user_message(user_id)
+    # Check if user can send message
+    can_send, reason = can_user_send_message(user_id)
 
-        if not consumed:
-            bot.send_message(chat_id, "❌ Errore durante l'elaborazione del messaggio.")
+    if not can_send:
+        if reason == "no_credits":
+            # Send credits needed message
+            bot.send_message(
+                chat_id,
+                "💔 Non hai abbastanza crediti per continuare la conversazione!\n\n"
+                "🪙 Acquista crediti per continuare a chattare."
+            )
+            send_pricing_menu(chat_id)
+            return
+        else:
+            bot.send_message(chat_id, "❌ Errore durante il controllo dei crediti.")
             return
 
-        # Get current profile for AI response
-        current_profile = user_chat_states[user_id]['current_profile']
+    # Kick off the AI call and typing indicator first so inference
+    # overlaps the credit bookkeeping below
+    current_profile = state.current_profile
+    ai_future = handler_executor.submit(query_huggingface_ai, text, current_profile.nome)
+    handler_executor.submit(bot.send_chat_action, chat_id, 'typing')
 
-        # Send typing indicator
-        bot.send_chat_action(chat_id, 'typing')
+    # Consume message (free or credits)
+    consumed, consumption_type = consume_user_message(user_id)
 
-        # Get AI response
-        ai_response = query_huggingface_ai(text, current_profile['nome'])
+    if not consumed:
+        ai_future.cancel()
+        bot.send_message(chat_id, "❌ Errore durante l'elaborazione del messaggio.")
+        return
 
-        # Send AI response
-        bot.send_message(chat_id, f"💬 {current_profile['nome']}: {ai_response}")
+    # Get AI response
+    ai_response = ai_future.result()
 
-        # Update message count
-        user_chat_states[user_id]['messages_sent'] += 1
+    # Send AI response
+    bot.send_message(chat_id, f"💬 {current_profile.nome}: {ai_response}")
 
-        logger.info(f"AI responded to user {user_id}, consumption: {consumption_type}")
+    # Update message count
+    with chat_states_lock:
+        current = user_chat_states.get(user_id)
+        if current is not None:
+            current.messages_sent += 1
+            current.last_activity = time.time()
 
-    except Exception as e:
-        logger.error(f"Error handling chat message from user {user_id}: {e}")
+    logger.info("AI responded to user %s, consumption: %s", user_id, consumption_type)
 
 @bot.message_handler(func=lambda message: message.text == BUTTONS["buy_credits"])
+@safe_handler
 def handle_buy_credits_message(message):
     """
     Handle buy credits button from keyboard - show pricing plans
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"User {user_id} clicked buy credits button")
+    logger.info("User %s clicked buy credits button", user_id)
 
-    try:
-        if check_channel_membership(user_id):
-            send_pricing_menu(chat_id)
-        else:
-            send_subscription_prompt(chat_id)
-    except Exception as e:
-        logger.error(f"Error handling buy credits message for user {user_id}: {e}")
+    if check_channel_membership(user_id):
+        send_pricing_menu(chat_id)
+    else:
+        send_subscription_prompt(chat_id)
 
 @bot.message_handler(commands=['ricarica'])
 def handle_recharge_command(message):
@@ -952,15 +1269,16 @@ def handle_recharge_command(message):
     user_id = message.from_user.id
     chat_id = message.chat.id
 
-    logger.info(f"User {user_id} used /ricarica command")
+    logger.info("User %s used /ricarica command", user_id)
 
     try:
         if not is_admin(user_id):
             bot.send_message(chat_id, "❌ Non hai i permessi per usare questo comando.")
             return
 
-        # Parse command arguments
-        command_parts = message.text.split()
+        # Parse command arguments - maxsplit bounds the work on long
+        # pasted input while a trailing extra token still fails the check
+        command_parts = message.text.split(maxsplit=3)
         if len(command_parts) != 3:
             bot.send_message(chat_id, "❌ Uso corretto: /ricarica <quantità> <codice_univoco>")
             return
@@ -1003,11 +1321,11 @@ def handle_recharge_command(message):
                 f"✅ I tuoi crediti sono stati impostati a {new_credits}."
             )
         except Exception as notify_error:
-            logger.error(f"Could not notify user {target_telegram_id}: {notify_error}")
+            logger.error("Could not notify user %s: %s", target_telegram_id, notify_error)
             bot.send_message(chat_id, "⚠️ Crediti aggiunti ma impossibile notificare l'utente.")
 
     except Exception as e:
-        logger.error(f"Error in /ricarica command: {e}")
+        logger.error("Error in /ricarica command: %s", e)
         bot.send_message(chat_id, "❌ Errore durante l'esecuzione del comando.")
 
 @bot.message_handler(commands=['info'])
@@ -1019,15 +1337,16 @@ def handle_info_command(message):
     user_id = message.from_user.id
     chat_id = message.chat.id
 
-    logger.info(f"User {user_id} used /info command")
+    logger.info("User %s used /info command", user_id)
 
     try:
         if not is_admin(user_id):
             bot.send_message(chat_id, "❌ Non hai i permessi per usare questo comando.")
             return
 
-        # Parse command arguments
-        command_parts = message.text.split()
+        # Parse command arguments - maxsplit bounds the work on long
+        # pasted input while a trailing extra token still fails the check
+        command_parts = message.text.split(maxsplit=2)
         if len(command_parts) != 2:
             bot.send_message(chat_id, "❌ Uso corretto: /info <codice_univoco>")
             return
@@ -1046,13 +1365,35 @@ def handle_info_command(message):
         bot.send_message(chat_id, info_text)
 
     except Exception as e:
-        logger.error(f"Error in /info command: {e}")
+        logger.error("Error in /info command: %s", e)
         bot.send_message(chat_id, "❌ Errore durante l'esecuzione del comando.")
 
+# Join approvals go through a queue drained by a single worker so a flood
+# of join requests can't tie up dispatcher threads; Telegram allows about
+# 20 requests/second to a group, so the worker paces itself accordingly
+APPROVE_RATE = 20
+_approve_queue = queue.Queue()
+_approve_bucket = TokenBucket(APPROVE_RATE, APPROVE_RATE)
+
+def _approve_worker():
+    while True:
+        chat_id, user_id = _approve_queue.get()
+        _approve_bucket.acquire()
+        try:
+            bot.approve_chat_join_request(chat_id, user_id)
+            # The user may have a cached "not subscribed" result - drop it
+            # so their next message sees the new membership immediately
+            invalidate_membership_cache(user_id)
+            logger.info("Approved join request from user %s", user_id)
+        except Exception as e:
+            logger.error("Error approving join request for %s: %s", user_id, e)
+
+threading.Thread(target=_approve_worker, daemon=True).start()
+
 @bot.chat_join_request_handler()
 def handle_join_request(join_request):
     """
-    Automatically approve join requests to the channel
+    Queue join requests to the channel for auto-approval
     """
     try:
         chat_id = join_request.chat.id
@@ -1060,10 +1401,45 @@ def handle_join_request(join_request):
 
         # Only handle requests for our specific channel
         if chat_id == CHANNEL_ID:
-            logger.info(f"Auto-approving join request from user {user_id}")
-            bot.approve_chat_join_request(chat_id, user_id)
+            _approve_queue.put((chat_id, user_id))
     except Exception as e:
-        logger.error(f"Error approving join request: {e}")
+        logger.error("Error queueing join request: %s", e)
+
+# Fresh secret per process - Telegram echoes it back on every webhook
+# delivery so the server can tell real updates from forged ones
+WEBHOOK_SECRET = secrets.token_urlsafe(32)
+
+def run_webhook_server():
+    """
+    Serve webhook updates pushed by Telegram on a small threaded HTTP server
+    """
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            # The port is internet-reachable, so only accept updates that
+            # carry the secret token we registered with set_webhook -
+            # anything else could be a forged update (e.g. a fake admin
+            # message) and gets dropped
+            token = self.headers.get('X-Telegram-Bot-Api-Secret-Token')
+            if not (token and secrets.compare_digest(token, WEBHOOK_SECRET)):
+                self.send_response(403)
+                self.end_headers()
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length).decode('utf-8')
+            try:
+                update = types.Update.de_json(body)
+                bot.process_new_updates([update])
+            except Exception as e:
+                logger.error("Error processing webhook update: %s", e)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            # Suppress per-request access lines on stderr
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", WEBHOOK_PORT), WebhookHandler)
+    server.serve_forever()
 
 def main():
     """
@@ -1071,19 +1447,33 @@ def main():
     """
     logger.info("Starting Telegram bot...")
 
+    # Flush pending user writes synchronously on SIGTERM
+    def handle_sigterm(signum, frame):
+        flush_dirty_users()
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     try:
         # Test bot token by getting bot info
         bot_info = bot.get_me()
-        logger.info(f"Bot started successfully: @{bot_info.username}")
-
-        # Start polling for messages
-        bot.infinity_polling(
-            timeout=60,
-            long_polling_timeout=60,
-            none_stop=True
-        )
+        logger.info("Bot started successfully: @%s", bot_info.username)
+
+        if WEBHOOK_URL:
+            # Webhook mode - Telegram pushes updates, no polling latency
+            bot.remove_webhook()
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            logger.info("Webhook set to %s, listening on port %s", WEBHOOK_URL, WEBHOOK_PORT)
+            run_webhook_server()
+        else:
+            # Start polling for messages - skip_pending avoids replaying
+            # a backlog of stale updates after a restart
+            bot.infinity_polling(
+                timeout=30,
+                long_polling_timeout=25,
+                skip_pending=True
+            )
     except Exception as e:
-        logger.error(f"Error starting bot: {e}")
+        logger.error("Error starting bot: %s", e)
         raise
 
 if __name__ == "__main__":